@@ -3,19 +3,79 @@ import sys
 import random
 import json
 import os
+import time
+import atexit
+import bisect
+import struct
+from collections import deque
+from itertools import repeat
+from telemetry import Telemetry
+from levels import CURVES, LevelStream
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # Initialize pygame
 pygame.init()
 
+
+
+def parse_resolution(value):
+    # Accepts "WIDTHxHEIGHT", e.g. "1050x700"
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+# Internal render resolution. Everything is drawn at this size and scaled once
+# per frame to the window, so weak machines can render at a lower resolution
+# and high-DPI displays at a higher one. Set FLAPPY_RESOLUTION to override.
+try:
+    WIDTH, HEIGHT = parse_resolution(os.environ.get('FLAPPY_RESOLUTION', '1500x1000'))
+except ValueError:
+    WIDTH, HEIGHT = 1500, 1000
+
+# Gameplay is tuned for a 1000 pixel tall playfield and scaled to HEIGHT
+SCALE = HEIGHT / 1000
+
+
+
+def px(value):
+    # Menu and HUD positions are laid out for a 1000 pixel tall screen
+    return int(value * SCALE)
+
+
 # Game constants
-WIDTH, HEIGHT = 1500, 1000
 FPS = 60
-GRAVITY = 0.25
-FLAP_STRENGTH = -7
-PIPE_SPEED = 6
-PIPE_GAP = 400
+GRAVITY = 0.25 * SCALE
+FLAP_STRENGTH = -7 * SCALE
+PIPE_WIDTH = int(50 * SCALE)
 PIPE_FREQUENCY = 1500  # milliseconds
-GROUND_HEIGHT = 120
+GROUND_HEIGHT = int(120 * SCALE)
+
+# The simulation advances in fixed steps; the per-step physics constants above
+# are tuned for 60 steps per second regardless of the display frame rate
+FRAME_MS = 1000 / FPS
+STEP_MS = 1000 / 60
+MAX_STEPS_PER_FRAME = 5
+
+# Difficulty curve for pipe gaps and speed (see levels.py); FLAPPY_DIFFICULTY
+# picks one of 'classic', 'normal' or 'hard'
+DIFFICULTY = os.environ.get('FLAPPY_DIFFICULTY', 'normal')
+if DIFFICULTY not in CURVES:
+    DIFFICULTY = 'normal'
+LEVEL_CURVE = CURVES[DIFFICULTY]
+
+# Ghost race: every run on the same seeded course is recorded and replayed
+GHOST_FILE = 'flappy_ghosts.json'
+GHOST_SEED = 20240601
+GHOST_COURSE = f"{GHOST_SEED}:{WIDTH}x{HEIGHT}:{DIFFICULTY}"  # the course depends on all three
+MAX_GHOSTS = 1000
+GHOST_ALPHA = 80
+
+# Print an input latency histogram after each game when FLAPPY_LATENCY=1
+LATENCY_REPORT = os.environ.get('FLAPPY_LATENCY') == '1'
 
 # Colors
 WHITE = (255, 255, 255)
@@ -29,15 +89,87 @@ PURPLE = (128, 0, 128)
 ORANGE = (255, 165, 0)
 GRAY = (128, 128, 128)
 
-# Set up the display
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
+# Set up the display. With pygame 2 the SDL2 renderer scales the render target
+# to the (resizable) window on the GPU. If no renderer is available we draw to
+# an offscreen surface and scale it to the window ourselves in present().
+try:
+    screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.SCALED | pygame.RESIZABLE)
+    window = None
+except (AttributeError, pygame.error):
+    window = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
+    screen = pygame.Surface((WIDTH, HEIGHT)).convert()
 pygame.display.set_caption('Flappy Bird')
 clock = pygame.time.Clock()
 
+# Events handled during play; everything else is kept off the queue
+GAME_EVENTS = [pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN,
+               pygame.VIDEORESIZE, pygame.VIDEOEXPOSE, pygame.ACTIVEEVENT]
+GAME_EVENTS += [getattr(pygame, name) for name in ('WINDOWEVENT', 'WINDOWRESIZED', 'WINDOWSIZECHANGED')
+                if hasattr(pygame, name)]
+
+# pygame.event.wait() only accepts a timeout from pygame 2 on
+EVENT_WAIT_TIMEOUT = pygame.version.vernum[0] >= 2
+
+
+# Gameplay event stream, written to flappy_telemetry.log once started
+telemetry = Telemetry()
+
+# Optional scripted input driver (see soak.py). When set it supplies the mouse
+# position, is notified after every presented frame and is handed each round's
+# GameSession as its .session so it can react to the bird.
+input_script = None
+
+
+def present():
+    # Show the finished frame in the window
+    if window is not None:
+        target = pygame.display.get_surface()
+        if target.get_size() == screen.get_size():
+            target.blit(screen, (0, 0))
+        else:
+            pygame.transform.scale(screen, target.get_size(), target)
+    pygame.display.flip()
+    if input_script is not None:
+        input_script.on_frame()
+
+
+def get_mouse_pos():
+    # Mouse position in render coordinates
+    if input_script is not None:
+        return input_script.mouse_pos
+    x, y = pygame.mouse.get_pos()
+    if window is None:
+        return x, y  # SDL already maps SCALED windows to render coordinates
+    target_width, target_height = pygame.display.get_surface().get_size()
+    return x * WIDTH // max(target_width, 1), y * HEIGHT // max(target_height, 1)
+
+
+def handle_resize(event):
+    # Without SCALED the window surface keeps its old size until set_mode is
+    # called again; present() then scales each frame to the new size
+    if event.type == pygame.VIDEORESIZE and window is not None:
+        pygame.display.set_mode(event.size, pygame.RESIZABLE)
+
 # Fonts
-title_font = pygame.font.Font(None, 50)
-font = pygame.font.Font(None, 36)
-small_font = pygame.font.Font(None, 24)
+title_font = pygame.font.Font(None, px(50))
+font = pygame.font.Font(None, px(36))
+small_font = pygame.font.Font(None, px(24))
+
+# Rendered text is cached so labels that did not change since the last frame are
+# not rendered again. The cache is bounded so changing scores can't grow it.
+TEXT_CACHE_SIZE = 256
+text_cache = {}
+
+
+def render_text(text_font, text, color):
+    key = (text_font, text, color)
+    surface = text_cache.get(key)
+    if surface is None:
+        if len(text_cache) >= TEXT_CACHE_SIZE:
+            text_cache.clear()
+        surface = text_font.render(text, True, color)
+        text_cache[key] = surface
+    return surface
 
 
 # Game state
@@ -137,8 +269,8 @@ class Bird:
         self.x = WIDTH // 4
         self.y = HEIGHT // 2
         self.velocity = 0
-        self.width = 30
-        self.height = 24
+        self.width = int(30 * SCALE)
+        self.height = int(24 * SCALE)
         self.game_state = game_state
         self.shop_items = shop_items
 
@@ -165,7 +297,8 @@ class Bird:
         pygame.draw.rect(screen, bird_color, bird_rect)
 
         # Draw the eye
-        pygame.draw.circle(screen, BLACK, (self.x + 10, self.y - 5), 3)
+        pygame.draw.circle(screen, BLACK, (self.x + int(10 * SCALE), self.y - int(5 * SCALE)),
+                           max(int(3 * SCALE), 1))
 
     def get_mask(self):
         return pygame.Rect(self.x - self.width // 2, self.y - self.height // 2,
@@ -173,18 +306,27 @@ class Bird:
 
 
 class Pipe:
-    def __init__(self, x, game_state, shop_items):
-        self.x = x
-        self.height = random.randint(150, 400)
-        self.top_pipe_rect = pygame.Rect(self.x, 0, 50, self.height - PIPE_GAP // 2)
-        self.bottom_pipe_rect = pygame.Rect(self.x, self.height + PIPE_GAP // 2,
-                                            50, HEIGHT - self.height - PIPE_GAP // 2 - GROUND_HEIGHT)
+    def __init__(self, x, game_state, shop_items, height, gap):
+        self.top_pipe_rect = pygame.Rect(0, 0, PIPE_WIDTH, 0)
+        self.bottom_pipe_rect = pygame.Rect(0, 0, PIPE_WIDTH, 0)
+        self.place(x, height, gap)
         self.passed = False
         self.game_state = game_state
         self.shop_items = shop_items
 
-    def update(self):
-        self.x -= PIPE_SPEED
+    def place(self, x, height, gap):
+        # Move the pipe and its gap, reusing the existing rects
+        self.x = x
+        self.height = height
+        self.gap = gap
+        self.top_pipe_rect.x = x
+        self.top_pipe_rect.height = height - gap // 2
+        self.bottom_pipe_rect.x = x
+        self.bottom_pipe_rect.y = height + gap // 2
+        self.bottom_pipe_rect.height = HEIGHT - height - gap // 2 - GROUND_HEIGHT
+
+    def update(self, speed):
+        self.x -= speed
         self.top_pipe_rect.x = self.x
         self.bottom_pipe_rect.x = self.x
 
@@ -200,6 +342,246 @@ class Pipe:
         return bird_mask.colliderect(self.top_pipe_rect) or bird_mask.colliderect(self.bottom_pipe_rect)
 
 
+class GameSession:
+    # The complete simulation state of one round, advanced in fixed steps.
+    # snapshot() and restore() copy it to and from a small fixed-layout buffer
+    # so rounds can be saved, rewound, retried or cloned cheaply.
+
+    # Bird y and velocity, simulated time, time of the last pipe, level seed
+    # and position, score, remaining token milestones (bit n = 10 * (n + 1)
+    # points), active flag and pipe count, followed by MAX_PIPES pipe slots
+    HEADER = struct.Struct('<ddddQIiHBB')
+    PIPE = struct.Struct('<diiB')  # x, gap height, gap size, passed
+    # Most pipes alive at once: a pipe lives for WIDTH + PIPE_WIDTH pixels and
+    # a new one spawns every PIPE_FREQUENCY ms, at the slowest curve's speed
+    MAX_PIPES = int((WIDTH + PIPE_WIDTH) / (min(curve.start_speed for curve in CURVES.values())
+                                            * SCALE * PIPE_FREQUENCY / STEP_MS)) + 2
+    SNAPSHOT_SIZE = HEADER.size + MAX_PIPES * PIPE.size
+
+    def __init__(self, game_state, shop_items, seed=None, level=None):
+        self.game_state = game_state
+        self.shop_items = shop_items
+        self.bird = Bird(game_state, shop_items)
+        self.pipes = []
+        self.score = 0  # copied to game_state only when the round ends
+        self.sim_time = 0.0  # milliseconds of simulated play
+        self.last_pipe = self.sim_time
+        self.game_active = True
+        self.death_cause = None  # 'pipe' or 'ground' once the round is over
+
+        # Token markers still to reach: bit n is set while 10 * (n + 1) points
+        # is ahead, for every 10 points up to 100
+        self.milestones = (1 << 10) - 1
+
+        # Pipe layouts come from a seeded level stream, so they are never
+        # generated during a step and a snapshot only needs the stream position
+        if level is None:
+            if seed is None:
+                seed = random.getrandbits(64)
+            level = LevelStream(seed, LEVEL_CURVE)
+        self.level = level
+
+    @property
+    def step_count(self):
+        return round(self.sim_time / STEP_MS)
+
+    @property
+    def next_milestone(self):
+        # Score of the next token marker, or None once all are reached
+        if not self.milestones:
+            return None
+        return 10 * (self.milestones & -self.milestones).bit_length()
+
+    def flap(self):
+        self.bird.flap()
+
+    def step(self):
+        # Advance the round by one STEP_MS simulation step
+        bird = self.bird
+        bird.update()
+        self.sim_time += STEP_MS
+        speed = self.level.curve.speed(self.score) * SCALE
+
+        # Add the next pipe of the level
+        if self.sim_time - self.last_pipe > PIPE_FREQUENCY:
+            height, gap = self.level.next_pipe()
+            self.pipes.append(Pipe(WIDTH, self.game_state, self.shop_items,
+                                   int(height * SCALE), int(gap * SCALE)))
+            self.last_pipe = self.sim_time
+
+        # Update pipes and check for scoring
+        pipes_to_remove = []
+        for pipe in self.pipes:
+            pipe.update(speed)
+
+            # Check if bird passed the pipe
+            if pipe.x + PIPE_WIDTH < bird.x and not pipe.passed:
+                pipe.passed = True
+                self.score += 1
+
+                # Check if token earned (every 10 points)
+                if self.score % 10 == 0:
+                    self.milestones &= ~(1 << (self.score // 10 - 1))
+
+            # Remove pipes that are off screen
+            if pipe.x + PIPE_WIDTH < 0:
+                pipes_to_remove.append(pipe)
+
+            # Check for collisions
+            if pipe.collide(bird):
+                self.game_active = False
+                self.death_cause = 'pipe'
+
+        # Remove old pipes
+        for pipe in pipes_to_remove:
+            self.pipes.remove(pipe)
+
+        # Check for ground collision
+        if bird.y + bird.height // 2 > HEIGHT - GROUND_HEIGHT:
+            self.game_active = False
+            self.death_cause = 'ground'
+
+    def snapshot(self):
+        buffer = bytearray(self.SNAPSHOT_SIZE)
+        self.snapshot_into(buffer)
+        return bytes(buffer)
+
+    def snapshot_into(self, buffer, offset=0):
+        # Write the state into a preallocated buffer of at least SNAPSHOT_SIZE bytes
+        if len(self.pipes) > self.MAX_PIPES:
+            raise ValueError(f"Cannot snapshot more than {self.MAX_PIPES} pipes")
+        self.HEADER.pack_into(buffer, offset, self.bird.y, self.bird.velocity, self.sim_time,
+                              self.last_pipe, self.level.seed, self.level.index, self.score,
+                              self.milestones, self.game_active, len(self.pipes))
+        offset += self.HEADER.size
+        for pipe in self.pipes:
+            self.PIPE.pack_into(buffer, offset, pipe.x, pipe.height, pipe.gap, pipe.passed)
+            offset += self.PIPE.size
+
+    def restore(self, buffer, offset=0):
+        # Load a state written by snapshot_into(), reusing existing Pipe objects
+        (self.bird.y, self.bird.velocity, self.sim_time, self.last_pipe, seed, index,
+         self.score, self.milestones, game_active, count) = self.HEADER.unpack_from(buffer, offset)
+        self.level.seek(index, seed)
+        self.game_active = bool(game_active)
+        if self.game_active:
+            self.death_cause = None
+
+        del self.pipes[count:]
+        while len(self.pipes) < count:
+            self.pipes.append(Pipe(WIDTH, self.game_state, self.shop_items, 0, 0))  # placed below
+        offset += self.HEADER.size
+        for pipe in self.pipes:
+            x, height, gap, passed = self.PIPE.unpack_from(buffer, offset)
+            pipe.place(x, height, gap)
+            pipe.passed = bool(passed)
+            offset += self.PIPE.size
+
+
+def load_ghost_runs():
+    # Recorded ghost race runs for the current course, oldest first
+    try:
+        if os.path.exists(GHOST_FILE):
+            with open(GHOST_FILE, 'r') as f:
+                data = json.load(f)
+                if data.get('course') == GHOST_COURSE:
+                    return data.get('runs', [])
+    except Exception:
+        # If there's any error, race without ghosts
+        pass
+    return []
+
+
+def save_ghost_run(flaps, steps):
+    runs = load_ghost_runs()
+    runs.append({'flaps': flaps, 'steps': steps})
+    data = {'course': GHOST_COURSE, 'runs': runs[-MAX_GHOSTS:]}
+    try:
+        with open(GHOST_FILE, 'w') as f:
+            json.dump(data, f)
+    except Exception:
+        # If there's an error, just continue
+        pass
+
+
+class GhostRace:
+    # Replays recorded runs as translucent birds. Ghosts share the player's x
+    # position, so only their heights are simulated: one array update per step
+    # for all of them (numpy when available), then drawn with a single blits()
+    # call of one cached sprite.
+
+    def __init__(self, runs, bird):
+        self.left = bird.x - bird.width // 2
+        self.half_height = bird.height // 2
+        self.start_y = bird.y
+        self.sprite = pygame.Surface((bird.width, bird.height), pygame.SRCALPHA)
+        color = bird.shop_items.birds[bird.game_state.current_bird]["color"]
+        self.sprite.fill(color + (GHOST_ALPHA,))
+        pygame.draw.circle(self.sprite, BLACK + (GHOST_ALPHA,),
+                           (bird.width // 2 + int(10 * SCALE), bird.height // 2 - int(5 * SCALE)),
+                           max(int(3 * SCALE), 1))
+        self.sprite = self.sprite.convert_alpha()
+
+        # Ghosts flapping on each step
+        flaps_at = {}
+        for index, run in enumerate(runs):
+            for step in run['flaps']:
+                flaps_at.setdefault(step, []).append(index)
+        if numpy is not None:
+            self.flaps_at = {step: numpy.array(indices) for step, indices in flaps_at.items()}
+            self.end_step = numpy.array([run['steps'] for run in runs])
+        else:
+            self.flaps_at = flaps_at
+            self.end_step = [run['steps'] for run in runs]
+        self.seek(0)
+
+    def seek(self, step):
+        # Restart every ghost and replay up to the given step
+        count = len(self.end_step)
+        if numpy is not None:
+            self.y = numpy.full(count, float(self.start_y))
+            self.velocity = numpy.zeros(count)
+        else:
+            self.y = [float(self.start_y)] * count
+            self.velocity = [0.0] * count
+        self.step_count = 0
+        while self.step_count < step:
+            self.step()
+
+    def step(self):
+        # Same physics as Bird.flap() and Bird.update(), for every ghost at once
+        flapping = self.flaps_at.get(self.step_count)
+        if numpy is not None:
+            if flapping is not None:
+                self.velocity[flapping] = FLAP_STRENGTH
+            self.velocity += GRAVITY
+            self.y += self.velocity
+            above = self.y < 0
+            self.y[above] = 0
+            self.velocity[above] = 0
+        else:
+            y, velocity = self.y, self.velocity
+            if flapping is not None:
+                for index in flapping:
+                    velocity[index] = FLAP_STRENGTH
+            for index in range(len(y)):
+                velocity[index] += GRAVITY
+                y[index] += velocity[index]
+                if y[index] < 0:
+                    y[index] = 0
+                    velocity[index] = 0
+        self.step_count += 1
+
+    def draw(self):
+        # Ghosts stay on screen until the step their run ended
+        if numpy is not None:
+            tops = (self.y[self.end_step >= self.step_count] - self.half_height).astype(int).tolist()
+        else:
+            tops = [int(y - self.half_height) for y, end in zip(self.y, self.end_step)
+                    if end >= self.step_count]
+        screen.blits(zip(repeat(self.sprite), zip(repeat(self.left), tops)), doreturn=False)
+
+
 class Button:
     def __init__(self, x, y, width, height, text, color=(100, 100, 100), hover_color=(150, 150, 150)):
         self.rect = pygame.Rect(x, y, width, height)
@@ -213,7 +595,7 @@ class Button:
         pygame.draw.rect(screen, color, self.rect)
         pygame.draw.rect(screen, BLACK, self.rect, 2)  # Border
 
-        text_surf = font.render(self.text, True, BLACK)
+        text_surf = render_text(font, self.text, BLACK)
         text_rect = text_surf.get_rect(center=self.rect.center)
         screen.blit(text_surf, text_rect)
 
@@ -241,9 +623,9 @@ def draw_background(game_state, shop_items):
         if game_state.current_background == "Sunset":
             cloud_color = (255, 218, 185)  # Peach for sunset clouds
 
-        pygame.draw.ellipse(screen, cloud_color, (50, 50, 80, 40))
-        pygame.draw.ellipse(screen, cloud_color, (200, 80, 100, 50))
-        pygame.draw.ellipse(screen, cloud_color, (300, 40, 70, 35))
+        pygame.draw.ellipse(screen, cloud_color, (px(50), px(50), px(80), px(40)))
+        pygame.draw.ellipse(screen, cloud_color, (px(200), px(80), px(100), px(50)))
+        pygame.draw.ellipse(screen, cloud_color, (px(300), px(40), px(70), px(35)))
     else:
         # Draw stars for night sky
         for _ in range(30):
@@ -253,29 +635,29 @@ def draw_background(game_state, shop_items):
 
 def draw_menu(game_state):
     # Draw title
-    title_text = title_font.render("FLAPPY BIRD", True, BLACK)
-    screen.blit(title_text, (WIDTH // 2 - title_text.get_width() // 2, 100))
+    title_text = render_text(title_font, "FLAPPY BIRD", BLACK)
+    screen.blit(title_text, (WIDTH // 2 - title_text.get_width() // 2, px(100)))
 
     # Draw high score
-    high_score_text = font.render(f"High Score: {game_state.high_score}", True, BLACK)
-    screen.blit(high_score_text, (WIDTH // 2 - high_score_text.get_width() // 2, 180))
+    high_score_text = render_text(font, f"High Score: {game_state.high_score}", BLACK)
+    screen.blit(high_score_text, (WIDTH // 2 - high_score_text.get_width() // 2, px(180)))
 
     # Draw tokens
-    tokens_text = font.render(f"Tokens: {game_state.tokens}", True, BLACK)
-    screen.blit(tokens_text, (WIDTH // 2 - tokens_text.get_width() // 2, 220))
+    tokens_text = render_text(font, f"Tokens: {game_state.tokens}", BLACK)
+    screen.blit(tokens_text, (WIDTH // 2 - tokens_text.get_width() // 2, px(220)))
 
 
 def draw_shop(game_state, shop_items, selected_tab):
     # Draw shop title
-    shop_title = title_font.render("SHOP", True, BLACK)
-    screen.blit(shop_title, (WIDTH // 2 - shop_title.get_width() // 2, 30))
+    shop_title = render_text(title_font, "SHOP", BLACK)
+    screen.blit(shop_title, (WIDTH // 2 - shop_title.get_width() // 2, px(30)))
 
     # Draw tokens
-    tokens_text = font.render(f"Tokens: {game_state.tokens}", True, BLACK)
-    screen.blit(tokens_text, (WIDTH // 2 - tokens_text.get_width() // 2, 80))
+    tokens_text = render_text(font, f"Tokens: {game_state.tokens}", BLACK)
+    screen.blit(tokens_text, (WIDTH // 2 - tokens_text.get_width() // 2, px(80)))
 
     # Draw tabs
-    y_pos = 130
+    y_pos = px(130)
 
     # Draw items based on selected tab
     items_to_display = []
@@ -288,7 +670,7 @@ def draw_shop(game_state, shop_items, selected_tab):
 
     for i, (item_name, item_data) in enumerate(items_to_display.items()):
         # Item rectangle
-        item_rect = pygame.Rect(50, y_pos + i * 60, WIDTH - 100, 50)
+        item_rect = pygame.Rect(px(50), y_pos + i * px(60), WIDTH - px(100), px(50))
 
         # Check if item is unlocked
         is_unlocked = False
@@ -319,45 +701,46 @@ def draw_shop(game_state, shop_items, selected_tab):
         pygame.draw.rect(screen, BLACK, item_rect, 2)  # Border
 
         # Draw color sample
-        color_rect = pygame.Rect(item_rect.x + 10, item_rect.y + 10, 30, 30)
+        color_rect = pygame.Rect(item_rect.x + px(10), item_rect.y + px(10), px(30), px(30))
         pygame.draw.rect(screen, item_data["color"], color_rect)
         pygame.draw.rect(screen, BLACK, color_rect, 1)
 
         # Draw item name
-        name_text = font.render(item_name, True, BLACK)
-        screen.blit(name_text, (item_rect.x + 50, item_rect.y + 15))
+        name_text = render_text(font, item_name, BLACK)
+        screen.blit(name_text, (item_rect.x + px(50), item_rect.y + px(15)))
 
         # Draw price or status
         if is_unlocked:
             if is_selected:
-                status_text = small_font.render("SELECTED", True, (0, 100, 0))
+                status_text = render_text(small_font, "SELECTED", (0, 100, 0))
             else:
-                status_text = small_font.render("OWNED", True, BLACK)
+                status_text = render_text(small_font, "OWNED", BLACK)
         else:
-            status_text = small_font.render(f"Price: {item_data['price']} tokens", True, BLACK)
+            status_text = render_text(small_font, f"Price: {item_data['price']} tokens", BLACK)
 
-        screen.blit(status_text, (item_rect.x + item_rect.width - status_text.get_width() - 10, item_rect.y + 15))
+        screen.blit(status_text, (item_rect.x + item_rect.width - status_text.get_width() - px(10), item_rect.y + px(15)))
 
 
 def shop_screen(game_state, shop_items):
     tab_buttons = [
-        Button(50, 120, 100, 40, "Birds"),
-        Button(WIDTH // 2 - 50, 120, 100, 40, "Pipes"),
-        Button(WIDTH - 150, 120, 100, 40, "Backgrounds")
+        Button(px(50), px(120), px(100), px(40), "Birds"),
+        Button(WIDTH // 2 - px(50), px(120), px(100), px(40), "Pipes"),
+        Button(WIDTH - px(150), px(120), px(100), px(40), "Backgrounds")
     ]
 
-    back_button = Button(10, 10, 80, 30, "Back")
+    back_button = Button(px(10), px(10), px(80), px(30), "Back")
     selected_tab = "Birds"
 
     running = True
     while running:
         click = False
-        mouse_pos = pygame.mouse.get_pos()
+        mouse_pos = get_mouse_pos()
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
+            handle_resize(event)
             if event.type == pygame.MOUSEBUTTONDOWN:
                 click = True
 
@@ -373,7 +756,7 @@ def shop_screen(game_state, shop_items):
 
         # Check for item clicks
         if click:
-            y_pos = 130
+            y_pos = px(130)
             items_to_check = []
 
             if selected_tab == "Birds":
@@ -384,7 +767,7 @@ def shop_screen(game_state, shop_items):
                 items_to_check = shop_items.backgrounds
 
             for i, (item_name, item_data) in enumerate(items_to_check.items()):
-                item_rect = pygame.Rect(50, y_pos + i * 60, WIDTH - 100, 50)
+                item_rect = pygame.Rect(px(50), y_pos + i * px(60), WIDTH - px(100), px(50))
 
                 if item_rect.collidepoint(mouse_pos):
                     # Check if already unlocked
@@ -408,6 +791,7 @@ def shop_screen(game_state, shop_items):
                     # Otherwise try to purchase
                     elif game_state.tokens >= item_data["price"]:
                         game_state.tokens -= item_data["price"]
+                        telemetry.emit('purchase', item=item_name, category=selected_tab, price=item_data["price"])
 
                         if selected_tab == "Birds":
                             game_state.unlocked_birds.append(item_name)
@@ -433,36 +817,41 @@ def shop_screen(game_state, shop_items):
         for button in tab_buttons:
             button.draw()
 
-        pygame.display.flip()
+        present()
         clock.tick(FPS)
 
 
 def main_menu(game_state, shop_items):
-    play_button = Button(WIDTH // 2 - 100, 260, 200, 50, "Play")
-    shop_button = Button(WIDTH // 2 - 100, 330, 200, 50, "Shop")
-    quit_button = Button(WIDTH // 2 - 100, 400, 200, 50, "Quit")
+    play_button = Button(WIDTH // 2 - px(100), px(260), px(200), px(50), "Play")
+    shop_button = Button(WIDTH // 2 - px(100), px(330), px(200), px(50), "Shop")
+    ghost_button = Button(WIDTH // 2 - px(100), px(400), px(200), px(50), "Ghost Race")
+    quit_button = Button(WIDTH // 2 - px(100), px(470), px(200), px(50), "Quit")
 
     running = True
     while running:
         click = False
-        mouse_pos = pygame.mouse.get_pos()
+        mouse_pos = get_mouse_pos()
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
+            handle_resize(event)
             if event.type == pygame.MOUSEBUTTONDOWN:
                 click = True
 
         # Update buttons
         play_button.update(mouse_pos)
         shop_button.update(mouse_pos)
+        ghost_button.update(mouse_pos)
         quit_button.update(mouse_pos)
 
         if play_button.check_click(mouse_pos, click):
             game_loop(game_state, shop_items)
         if shop_button.check_click(mouse_pos, click):
             shop_screen(game_state, shop_items)
+        if ghost_button.check_click(mouse_pos, click):
+            game_loop(game_state, shop_items, ghost_race=True)
         if quit_button.check_click(mouse_pos, click):
             pygame.quit()
             sys.exit()
@@ -475,141 +864,243 @@ def main_menu(game_state, shop_items):
         # Draw buttons
         play_button.draw()
         shop_button.draw()
+        ghost_button.draw()
         quit_button.draw()
 
-        pygame.display.flip()
+        present()
         clock.tick(FPS)
 
 
-def game_loop(game_state, shop_items):
-    bird = Bird(game_state, shop_items)
-    pipes = []
-    game_state.score = 0
-    last_pipe = pygame.time.get_ticks()
-    game_active = True
+def now_ms():
+    return time.perf_counter() * 1000
 
-    # Calculate tokens earned markers
-    tokens_at_score = []
-    for i in range(10, 101, 10):  # Show markers for every 10 points up to 100
-        tokens_at_score.append(i)
 
+def wait_for_events(deadline):
+    # Sleep until deadline (in now_ms() time) while collecting input, stamping
+    # each event with the time it arrived rather than the time it is handled
+    events = []
     while True:
-        current_time = pygame.time.get_ticks()
-        click = False
+        stamp = now_ms()
+        for event in pygame.event.get():
+            events.append((stamp, event))
+        remaining = deadline - now_ms()
+        if remaining <= 0:
+            return events
+        if remaining < 1:
+            continue  # Spin through the last millisecond instead of overshooting
+        if EVENT_WAIT_TIMEOUT:
+            # Whole milliseconds rounded down, so the wait ends before the deadline
+            event = pygame.event.wait(int(remaining))
+            if event.type != pygame.NOEVENT:
+                events.append((now_ms(), event))
+        else:
+            # pygame 1: poll every millisecond
+            pygame.time.wait(1)
+
+
+class LatencyHistogram:
+    # Time from an input event to the first displayed frame that reflects it
+    BUCKETS = [5, 10, 17, 25, 33, 50, 67, 100]  # upper bounds in milliseconds
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.samples = 0
+        self.total = 0.0
+        self.worst = 0.0
+
+    def record(self, latency):
+        self.counts[bisect.bisect_left(self.BUCKETS, latency)] += 1
+        self.samples += 1
+        self.total += latency
+        self.worst = max(self.worst, latency)
+
+    def report(self):
+        lines = [f"Input latency: {self.samples} samples, "
+                 f"mean {self.total / max(self.samples, 1):.1f} ms, worst {self.worst:.1f} ms"]
+        lower = 0
+        for upper, count in zip(self.BUCKETS + [None], self.counts):
+            label = f"{lower:>3}-{upper:<3} ms" if upper is not None else f"{lower:>3}+     ms"
+            lines.append(f"  {label} {count:6d} {'#' * (count * 40 // max(self.samples, 1))}")
+            lower = upper
+        return "\n".join(lines)
+
+
+def game_loop(game_state, shop_items, ghost_race=False):
+    # Only queue the events the game reacts to, so mouse motion and the like
+    # never delay a flap
+    pygame.event.set_blocked(None)
+    pygame.event.set_allowed(GAME_EVENTS)
+    latency = LatencyHistogram()
+    # Everyone races the same course in ghost race mode. The level's first
+    # chunk is generated here and the rest ahead of the player in the
+    # background, so no level generation happens in the frame loop.
+    seed = GHOST_SEED if ghost_race else random.getrandbits(64)
+    level = LevelStream(seed, LEVEL_CURVE, background=True)
+    try:
+        play_round(game_state, shop_items, latency, level, ghost_race)
+    finally:
+        level.close()
+        # A QUIT during the round has already shut pygame down
+        if pygame.get_init():
+            pygame.event.set_allowed(None)
+        if LATENCY_REPORT and latency.samples:
+            print(latency.report())
+
+
+def play_round(game_state, shop_items, latency, level, ghost_race=False):
+    session = GameSession(game_state, shop_items, level=level)
+    if input_script is not None:
+        input_script.session = session
+    ghosts = None
+    if ghost_race:
+        runs = load_ghost_runs()
+        if runs:
+            ghosts = GhostRace(runs, session.bird)
+    checkpoint = None
+    flap_steps = []  # steps at which the player flapped, for replaying this run
+
+    pending_flaps = deque()  # input timestamps not yet simulated
+    applied_flaps = []  # input timestamps simulated but not yet on screen
+    sim_clock = now_ms()  # wall clock time the simulation has caught up to
+    next_frame = sim_clock
+
+    while True:
+        # Wait for the next frame, collecting timestamped input meanwhile
+        next_frame = max(next_frame + FRAME_MS, now_ms())
 
         # Event handling
-        for event in pygame.event.get():
+        for stamp, event in wait_for_events(next_frame):
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
+            handle_resize(event)
 
             if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_SPACE and game_active:
-                    bird.flap()
-                if event.key == pygame.K_SPACE and not game_active:
+                if event.key == pygame.K_F5 and session.game_active:
+                    checkpoint = session.snapshot()  # Save a checkpoint
+                    continue
+                if event.key == pygame.K_F9 and checkpoint is not None and session.game_active:
+                    # Retry from the checkpoint. Only while alive: a death has
+                    # already been scored, logged and saved as a ghost run.
+                    session.restore(checkpoint)
+                    pending_flaps.clear()
+                    sim_clock = stamp
+                    while flap_steps and flap_steps[-1] >= session.step_count:
+                        flap_steps.pop()
+                    if ghosts is not None:
+                        ghosts.seek(session.step_count)
+                    continue
+                if event.key == pygame.K_SPACE and session.game_active:
+                    pending_flaps.append(stamp)
+                if event.key == pygame.K_SPACE and not session.game_active:
                     return  # Return to main menu
                 if event.key == pygame.K_ESCAPE:
                     return  # Return to main menu
 
             if event.type == pygame.MOUSEBUTTONDOWN:
-                click = True
-                if game_active:
-                    bird.flap()
+                if session.game_active:
+                    pending_flaps.append(stamp)
                 else:
                     return  # Return to main menu
 
-        if game_active:
-            # Update
-            bird.update()
-
-            # Generate new pipes
-            if current_time - last_pipe > PIPE_FREQUENCY:
-                pipes.append(Pipe(WIDTH, game_state, shop_items))
-                last_pipe = current_time
-
-            # Update pipes and check for scoring
-            pipes_to_remove = []
-            for pipe in pipes:
-                pipe.update()
-
-                # Check if bird passed the pipe
-                if pipe.x + 50 < bird.x and not pipe.passed:
-                    pipe.passed = True
-                    game_state.score += 1
-
-                    # Check if token earned (every 10 points)
-                    if game_state.score in tokens_at_score:
-                        tokens_at_score.remove(game_state.score)
-
-                # Remove pipes that are off screen
-                if pipe.x + 50 < 0:
-                    pipes_to_remove.append(pipe)
-
-                # Check for collisions
-                if pipe.collide(bird):
-                    game_active = False
-                    game_state.update_score(game_state.score)
-
-            # Remove old pipes
-            for pipe in pipes_to_remove:
-                pipes.remove(pipe)
-
-            # Check for ground collision
-            if bird.y + bird.height // 2 > HEIGHT - GROUND_HEIGHT:
-                game_active = False
-                game_state.update_score(game_state.score)
+        # Advance the simulation in fixed steps up to the current time
+        frame_time = now_ms()
+        steps = 0
+        while session.game_active and sim_clock + STEP_MS <= frame_time:
+            step_end = sim_clock + STEP_MS
+
+            # Apply each flap in the step during which it happened
+            while pending_flaps and pending_flaps[0] < step_end:
+                session.flap()
+                flap_steps.append(session.step_count)
+                telemetry.emit('flap', step=session.step_count)
+                applied_flaps.append(pending_flaps.popleft())
+
+            score = session.score
+            session.step()
+            if ghosts is not None:
+                ghosts.step()
+            if session.score != score:
+                telemetry.emit('pass', score=session.score)
+            if not session.game_active:
+                telemetry.emit('death', cause=session.death_cause, score=session.score,
+                               y=round(session.bird.y / HEIGHT, 3), time=round(session.sim_time),
+                               ghost_race=ghost_race)
+                game_state.update_score(session.score)
+                if ghost_race:
+                    save_ghost_run(flap_steps, session.step_count)
+
+            sim_clock = step_end
+            steps += 1
+            if steps == MAX_STEPS_PER_FRAME:
+                # Too far behind to catch up; drop the backlog instead of stalling
+                sim_clock = frame_time
+                break
+
+        if not session.game_active:
+            pending_flaps.clear()
 
         # Draw
         draw_background(game_state, shop_items)
 
         # Draw pipes
-        for pipe in pipes:
+        for pipe in session.pipes:
             pipe.draw()
 
         # Draw floor
         draw_floor()
 
+        # Draw ghosts behind the player
+        if ghosts is not None:
+            ghosts.draw()
+
         # Draw bird
-        bird.draw()
+        session.bird.draw()
 
         # Draw score
-        score_text = font.render(f'Score: {game_state.score}', True, BLACK)
-        screen.blit(score_text, (10, 10))
+        score_text = render_text(font, f'Score: {session.score}', BLACK)
+        screen.blit(score_text, (px(10), px(10)))
 
         # Draw tokens
-        tokens_text = font.render(f'Tokens: {game_state.tokens}', True, BLACK)
-        screen.blit(tokens_text, (10, 50))
+        tokens_text = render_text(font, f'Tokens: {game_state.tokens}', BLACK)
+        screen.blit(tokens_text, (px(10), px(50)))
 
         # Draw high score
-        high_score_text = font.render(f'High Score: {game_state.high_score}', True, BLACK)
-        screen.blit(high_score_text, (WIDTH - high_score_text.get_width() - 10, 10))
+        high_score_text = render_text(font, f'High Score: {game_state.high_score}', BLACK)
+        screen.blit(high_score_text, (WIDTH - high_score_text.get_width() - px(10), px(10)))
 
         # Show next token milestone
-        if tokens_at_score and game_active:
-            next_token_text = small_font.render(f'Next token at: {tokens_at_score[0]} points', True, BLACK)
-            screen.blit(next_token_text, (10, 90))
+        if session.milestones and session.game_active:
+            next_token_text = render_text(small_font, f'Next token at: {session.next_milestone} points', BLACK)
+            screen.blit(next_token_text, (px(10), px(90)))
 
         # Game over text
-        if not game_active:
-            game_over_text = font.render('Game Over!', True, BLACK)
-            screen.blit(game_over_text, (WIDTH // 2 - game_over_text.get_width() // 2, HEIGHT // 2 - 50))
+        if not session.game_active:
+            game_over_text = render_text(font, 'Game Over!', BLACK)
+            screen.blit(game_over_text, (WIDTH // 2 - game_over_text.get_width() // 2, HEIGHT // 2 - px(50)))
 
-            final_score_text = font.render(f'Final Score: {game_state.score}', True, BLACK)
+            final_score_text = render_text(font, f'Final Score: {session.score}', BLACK)
             screen.blit(final_score_text, (WIDTH // 2 - final_score_text.get_width() // 2, HEIGHT // 2))
 
-            if game_state.score == game_state.high_score and game_state.score > 0:
-                new_high_text = font.render('New High Score!', True, (255, 0, 0))
-                screen.blit(new_high_text, (WIDTH // 2 - new_high_text.get_width() // 2, HEIGHT // 2 + 40))
+            if session.score == game_state.high_score and session.score > 0:
+                new_high_text = render_text(font, 'New High Score!', (255, 0, 0))
+                screen.blit(new_high_text, (WIDTH // 2 - new_high_text.get_width() // 2, HEIGHT // 2 + px(40)))
 
-            back_text = font.render('Press SPACE or Click to continue', True, BLACK)
-            screen.blit(back_text, (WIDTH // 2 - back_text.get_width() // 2, HEIGHT // 2 + 80))
+            back_text = render_text(font, 'Press SPACE or Click to continue', BLACK)
+            screen.blit(back_text, (WIDTH // 2 - back_text.get_width() // 2, HEIGHT // 2 + px(80)))
 
         # Update display
-        pygame.display.flip()
-        clock.tick(FPS)
+        present()
+
+        shown = now_ms()
+        for stamp in applied_flaps:
+            latency.record(shown - stamp)
+        applied_flaps.clear()
 
 
 if __name__ == "__main__":
+    telemetry.start()
+    atexit.register(telemetry.stop)
     game_state = GameState()
     shop_items = ShopItems()
     main_menu(game_state, shop_items)
@@ -0,0 +1,125 @@
+import random
+import threading
+
+# Level generation settings
+CHUNK_SIZE = 32  # pipes generated at a time
+PREFETCH_CHUNKS = 2  # chunks kept ready ahead of the player
+PIPE_MIN_HEIGHT = 150  # gap centre range, in pixels of a 1000 pixel tall playfield
+PIPE_MAX_HEIGHT = 400
+
+
+class DifficultyCurve:
+    # Pipe gap and pipe speed as the score rises, in pixels (and pixels per
+    # step) of a 1000 pixel tall playfield
+
+    def __init__(self, gap, min_gap, gap_step, speed, max_speed, speed_step):
+        self.start_gap = gap
+        self.min_gap = min_gap
+        self.gap_step = gap_step
+        self.start_speed = speed
+        self.max_speed = max_speed
+        self.speed_step = speed_step
+
+    def gap(self, score):
+        return max(self.min_gap, self.start_gap - self.gap_step * score)
+
+    def speed(self, score):
+        return min(self.max_speed, self.start_speed + self.speed_step * score)
+
+
+CURVES = {
+    'classic': DifficultyCurve(400, 400, 0, 6, 6, 0),  # the original fixed constants
+    'normal': DifficultyCurve(400, 250, 5, 6, 9, 0.1),
+    'hard': DifficultyCurve(300, 180, 8, 8, 12, 0.2),
+}
+
+
+def generate_chunk(seed, number, curve):
+    # Pipes number * CHUNK_SIZE onwards as (gap centre, gap size) pairs. Each
+    # chunk depends only on its seed and number, so any chunk can be rebuilt.
+    # Pipe n is the one passed at score n, so the curve is applied per pipe.
+    rng = random.Random(f"{seed}/{number}")
+    first = number * CHUNK_SIZE
+    return [(rng.randint(PIPE_MIN_HEIGHT, PIPE_MAX_HEIGHT), curve.gap(index))
+            for index in range(first, first + CHUNK_SIZE)]
+
+
+class LevelStream:
+    # The pipe layouts of one seeded level, in order. With background=True a
+    # producer thread generates chunks ahead of the player so next_pipe() only
+    # looks them up, waiting on the producer if it is ever behind; otherwise
+    # chunks are generated lazily on first use, which is what headless
+    # simulations and bots want.
+
+    def __init__(self, seed, curve, background=False):
+        self.seed = seed
+        self.curve = curve
+        self.index = 0
+        self.chunks = {}
+        self.lock = threading.Lock()  # keeps seed and chunks consistent for the producer
+        self.ready = threading.Condition(self.lock)  # notified when a chunk is produced
+        self.wanted = threading.Event()
+        self.thread = None
+        self.chunks[0] = generate_chunk(seed, 0, curve)  # before play starts
+        if background:
+            self.thread = threading.Thread(target=self.produce, name='levels', daemon=True)
+            self.thread.start()
+            self.wanted.set()
+
+    def chunk(self, number):
+        # number is always the chunk of the current index, which is the first
+        # one the producer generates after being woken
+        chunk = self.chunks.get(number)
+        if chunk is None:
+            if self.thread is None:
+                chunk = generate_chunk(self.seed, number, self.curve)
+                self.chunks[number] = chunk
+            else:
+                # Wait for the producer rather than generating on the game thread
+                with self.ready:
+                    self.wanted.set()
+                    chunk = self.ready.wait_for(lambda: self.chunks.get(number))
+        return chunk
+
+    def next_pipe(self):
+        number, offset = divmod(self.index, CHUNK_SIZE)
+        pipe = self.chunk(number)[offset]
+        self.index += 1
+        if offset == 0:
+            # Entered a new chunk: drop older ones, keeping the one before it
+            # for checkpoints, and have the producer refill
+            self.chunks.pop(number - 2, None)
+            self.wanted.set()
+        return pipe
+
+    def seek(self, index, seed=None):
+        # Continue the stream from pipe index, e.g. after restoring a snapshot
+        if seed is not None and seed != self.seed:
+            with self.lock:
+                self.seed = seed
+                self.chunks = {}
+        self.index = index
+        self.wanted.set()
+
+    def produce(self):
+        while self.thread is not None:
+            self.wanted.wait()
+            self.wanted.clear()
+            # A seek() to another seed replaces the dict, so stale chunks can't leak in
+            with self.lock:
+                seed, chunks = self.seed, self.chunks
+            number = self.index // CHUNK_SIZE
+            for ahead in range(number, number + PREFETCH_CHUNKS + 1):
+                if self.thread is None:
+                    break
+                if ahead not in chunks:
+                    chunk = generate_chunk(seed, ahead, self.curve)
+                    with self.ready:
+                        chunks[ahead] = chunk
+                        self.ready.notify_all()
+
+    def close(self):
+        thread, self.thread = self.thread, None
+        if thread is not None:
+            self.wanted.set()
+            thread.join()
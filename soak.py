@@ -0,0 +1,219 @@
+import os
+import sys
+import gc
+import time
+import tempfile
+import tracemalloc
+
+# Run without a window or sound card
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+import flappybird as game
+
+# Soak settings
+SOAK_HOURS = float(os.environ.get('FLAPPY_SOAK_HOURS', 4))
+SOAK_CYCLES = int(os.environ.get('FLAPPY_SOAK_CYCLES', 0))  # 0 = run for SOAK_HOURS
+WARMUP_CYCLES = 3  # caches fill up during the first few cycles
+GROWTH_LIMIT = 4096  # bytes per cycle of steady memory growth that fails the run
+TOP_GROWTH = 15  # source lines listed when the growth check fails
+FRAME_ALLOC_BUDGET = 64 * 1024  # bytes allocated at peak within a single frame
+
+# Scripted input timing, in frames
+GAME_FRAMES = 60 * 30  # leave a round with ESC after this long
+STEP_FRAMES = 5  # pause between menu/shop clicks
+FLAP_MARGIN = 40  # flap once the falling bird is this far below the gap centre
+
+
+class SoakFinished(Exception):
+    pass
+
+
+CONTAINERS = (dict, list, tuple, set, frozenset)
+
+
+def count_objects():
+    # Rect and Surface objects are not tracked by the garbage collector, and
+    # after a collection neither are containers that only hold untracked
+    # objects (such as the text cache), so gc.get_objects() alone misses them.
+    # Walk references from every tracked object down through all containers.
+    counts = {'Pipe': 0, 'Rect': 0, 'Surface': 0}
+    seen = set()
+    pending = gc.get_objects()
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, game.Pipe):
+            counts['Pipe'] += 1
+        elif isinstance(obj, pygame.Rect):
+            counts['Rect'] += 1
+        elif isinstance(obj, pygame.Surface):
+            counts['Surface'] += 1
+        for ref in gc.get_referents(obj):
+            if id(ref) not in seen and (gc.is_tracked(ref) or isinstance(ref, CONTAINERS)
+                                        or isinstance(ref, (pygame.Rect, pygame.Surface))):
+                pending.append(ref)
+
+    # Text surfaces are counted where they are held
+    counts['Text'] = len(game.text_cache)
+    return counts
+
+
+def take_snapshot():
+    # Leave out tracemalloc's own bookkeeping
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+
+
+def growth_per_cycle(samples):
+    # Least squares slope of memory use over cycle number
+    n = len(samples)
+    if n < 2:
+        return 0.0
+    mean_x = (n - 1) / 2
+    mean_y = sum(samples) / n
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(samples))
+    variance = sum((x - mean_x) ** 2 for x in range(n))
+    return covariance / variance
+
+
+class SoakScript:
+    # Drives main_menu -> game_loop -> shop_screen cycles by posting input
+    # after every presented frame
+
+    def __init__(self, deadline, max_cycles):
+        self.deadline = deadline
+        self.max_cycles = max_cycles
+        self.mouse_pos = (0, 0)
+        self.session = None  # set by play_round for every round
+        self.actions = []
+        self.cycle = 0
+        self.memory = []
+        self.baseline = None  # tracemalloc snapshots at the end of warmup and of the run
+        self.final = None
+        self.worst_frame = 0
+        self.frames_over_budget = 0
+        self.frame_start = tracemalloc.get_traced_memory()[0]
+        self.plan_cycle()
+
+    def plan_cycle(self):
+        # One cycle as a list of (frames to wait, action)
+        center, px = game.WIDTH // 2, game.px
+        self.actions = [
+            (STEP_FRAMES, lambda: self.click((center, px(285)))),  # Play
+            (GAME_FRAMES, self.leave_round),
+            (STEP_FRAMES, lambda: self.click((center, px(355)))),  # Shop
+            (STEP_FRAMES, lambda: self.click((center, px(140)))),  # Pipes tab
+            (STEP_FRAMES, lambda: self.click((center, px(170)))),  # Select first pipe
+            (STEP_FRAMES, lambda: self.click((center, px(275)))),  # Try to buy third pipe
+            (STEP_FRAMES, lambda: self.click((px(50), px(25)))),  # Back
+            (STEP_FRAMES, self.end_cycle),
+        ]
+        self.wait = self.actions[0][0]
+
+    def click(self, pos):
+        self.mouse_pos = pos
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=pos, button=1))
+
+    def press(self, key):
+        pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=key, mod=0, unicode='', scancode=0))
+
+    def leave_round(self):
+        self.session = None
+        self.press(pygame.K_ESCAPE)  # ignored if the round already ended
+
+    def steer(self):
+        # Aim for the gap of the next pipe the bird hasn't cleared, flapping
+        # whenever it falls below the gap centre, so rounds score, remove
+        # passed pipes and reach token milestones for the whole GAME_FRAMES
+        session = self.session
+        bird = session.bird
+        target = game.HEIGHT // 2
+        for pipe in session.pipes:
+            if pipe.x + game.PIPE_WIDTH >= bird.x - bird.width // 2:
+                target = pipe.height
+                break
+        if bird.velocity >= 0 and bird.y > target + game.px(FLAP_MARGIN):
+            self.press(pygame.K_SPACE)
+
+    def on_frame(self):
+        current, peak = tracemalloc.get_traced_memory()
+        frame_alloc = peak - self.frame_start
+        self.worst_frame = max(self.worst_frame, frame_alloc)
+        if frame_alloc > FRAME_ALLOC_BUDGET:
+            self.frames_over_budget += 1
+
+        if self.session is not None and self.session.game_active:
+            self.steer()
+
+        self.wait -= 1
+        if self.wait <= 0:
+            action = self.actions.pop(0)[1]
+            action()
+            if self.actions:
+                self.wait = self.actions[0][0]
+
+        tracemalloc.reset_peak()
+        self.frame_start = tracemalloc.get_traced_memory()[0]
+
+    def end_cycle(self):
+        gc.collect()
+        self.cycle += 1
+        self.memory.append(tracemalloc.get_traced_memory()[0])
+        counts = count_objects()
+        print(f"cycle {self.cycle}: traced {self.memory[-1] / 1024:.1f} KiB, "
+              f"Pipe {counts['Pipe']}, Rect {counts['Rect']}, Surface {counts['Surface']}, "
+              f"text surfaces {counts['Text']}, worst frame {self.worst_frame / 1024:.1f} KiB")
+        sys.stdout.flush()
+
+        if self.cycle == WARMUP_CYCLES:
+            self.baseline = take_snapshot()
+        if self.cycle >= self.max_cycles > 0 or time.time() >= self.deadline:
+            self.final = take_snapshot()
+            raise SoakFinished()
+        self.plan_cycle()
+
+
+def main():
+    # Keep the soak run's saves away from the player's flappy_data.json
+    os.chdir(tempfile.mkdtemp(prefix='flappy_soak_'))
+    game.telemetry.start()
+
+    tracemalloc.start()
+    script = SoakScript(time.time() + SOAK_HOURS * 3600, SOAK_CYCLES)
+    game.input_script = script
+
+    try:
+        game.main_menu(game.GameState(), game.ShopItems())
+    except SoakFinished:
+        pass
+    finally:
+        game.telemetry.stop()
+        pygame.quit()
+
+    steady = script.memory[WARMUP_CYCLES:]
+    growth = growth_per_cycle(steady)
+    print(f"{script.cycle} cycles, memory growth {growth:.0f} bytes/cycle after warmup, "
+          f"worst frame {script.worst_frame} bytes, {script.frames_over_budget} frames over budget")
+
+    failed = False
+    if len(steady) >= 2 and growth > GROWTH_LIMIT:
+        print(f"FAIL: memory grows by more than {GROWTH_LIMIT} bytes per cycle")
+        if script.baseline is not None and script.final is not None:
+            print("Largest growth since the end of warmup:")
+            for stat in script.final.compare_to(script.baseline, 'lineno')[:TOP_GROWTH]:
+                print(f"  {stat}")
+        failed = True
+    if script.frames_over_budget:
+        print(f"FAIL: frames allocated more than {FRAME_ALLOC_BUDGET} bytes")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import os
+import sys
+import json
+import math
+import time
+import threading
+
+# Telemetry configuration
+LOG_FILE = 'flappy_telemetry.log'
+MAX_LOG_BYTES = 8 * 1024 * 1024  # rotate the log once it reaches this size
+BACKUP_COUNT = 5  # rotated logs kept as flappy_telemetry.log.1 ... .5
+FLUSH_INTERVAL = 2.0  # seconds between background flushes
+FLUSH_EVENTS = 256  # flush early once this many events are buffered
+
+# Aggregation settings
+HEATMAP_ROWS = 10  # bands of playfield height, top to bottom
+HEATMAP_SECONDS = 5  # width of each time column
+HEATMAP_COLUMNS = 12
+SCORE_BUCKET = 5
+
+
+class Telemetry:
+    # Gameplay event stream. emit() only appends to an in-memory buffer; a
+    # background thread encodes the events as JSON lines, appends them to the
+    # log and rotates it when it grows past max_bytes.
+
+    def __init__(self, path=LOG_FILE, max_bytes=MAX_LOG_BYTES, backups=BACKUP_COUNT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.file = None
+        self.session = None
+
+    def start(self):
+        # Events emitted before start() are dropped
+        self.path = os.path.abspath(self.path)
+        self.session = f"{int(time.time())}-{os.getpid()}"
+        self.thread = threading.Thread(target=self.run, name='telemetry', daemon=True)
+        self.thread.start()
+        self.emit('session_start')
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.emit('session_stop')
+        thread, self.thread = self.thread, None
+        self.wake.set()
+        thread.join()
+
+    def emit(self, event, **fields):
+        if self.thread is None:
+            return
+        with self.lock:
+            self.buffer.append((time.time(), event, fields))
+            if len(self.buffer) >= FLUSH_EVENTS:
+                self.wake.set()
+
+    def run(self):
+        while self.thread is not None:
+            self.wake.wait(FLUSH_INTERVAL)
+            self.wake.clear()
+            self.flush()
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def flush(self):
+        with self.lock:
+            events, self.buffer = self.buffer, []
+        if not events:
+            return
+
+        lines = []
+        for stamp, event, fields in events:
+            fields['t'] = round(stamp, 3)
+            fields['e'] = event
+            fields['s'] = self.session
+            lines.append(json.dumps(fields, separators=(',', ':')))
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+
+        try:
+            if self.file is None:
+                self.file = open(self.path, 'ab')
+            if self.file.tell() and self.file.tell() + len(data) > self.max_bytes:
+                self.rotate()
+            self.file.write(data)
+            self.file.flush()
+        except Exception:
+            # Telemetry must never take the game down
+            pass
+
+    def rotate(self):
+        self.file.close()
+        for index in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, 'ab')
+
+
+def log_files(path=LOG_FILE, backups=BACKUP_COUNT):
+    # The current log and its rotated backups, oldest first
+    files = [f"{path}.{index}" for index in range(backups, 0, -1)] + [path]
+    return [name for name in files if os.path.exists(name)]
+
+
+def read_events(paths):
+    # Stream events one line at a time so logs of any size can be aggregated
+    for path in paths:
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # Skip lines cut short by a crash
+                    continue
+                if isinstance(event, dict) and isinstance(event.get('e'), str):
+                    yield event
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+class Aggregate:
+    # Running totals over an event stream; memory use does not depend on
+    # the number of events
+
+    def __init__(self):
+        self.counts = {}
+        self.sessions = set()
+        self.deaths = {'pipe': 0, 'ground': 0}
+        self.heatmap = [[0] * HEATMAP_COLUMNS for _ in range(HEATMAP_ROWS)]
+        self.scores = {}
+        self.purchases = {}
+
+    def add(self, event):
+        # Malformed events are skipped rather than stopping the whole run
+        kind = event.get('e')
+        if kind == 'session_start':
+            session = event.get('s')
+            if not isinstance(session, str):
+                return
+            self.sessions.add(session)
+        elif kind == 'death':
+            cause, y, elapsed, score = (event.get('cause'), event.get('y'),
+                                        event.get('time'), event.get('score'))
+            if not (isinstance(cause, str) and is_number(y) and is_number(elapsed) and is_number(score)):
+                return
+            self.deaths[cause] = self.deaths.get(cause, 0) + 1
+            row = min(max(int(y * HEATMAP_ROWS), 0), HEATMAP_ROWS - 1)
+            column = min(max(int(elapsed / 1000 / HEATMAP_SECONDS), 0), HEATMAP_COLUMNS - 1)
+            self.heatmap[row][column] += 1
+            bucket = int(score) // SCORE_BUCKET * SCORE_BUCKET
+            self.scores[bucket] = self.scores.get(bucket, 0) + 1
+        elif kind == 'purchase':
+            item = event.get('item')
+            if not isinstance(item, str):
+                return
+            self.purchases[item] = self.purchases.get(item, 0) + 1
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def report(self):
+        lines = [f"Sessions: {len(self.sessions)}"]
+        for kind in sorted(self.counts, key=str):
+            lines.append(f"  {kind}: {self.counts[kind]}")
+
+        total_deaths = sum(self.deaths.values())
+        lines.append(f"\nDeaths: {total_deaths} "
+                     + ", ".join(f"{cause} {count}" for cause, count in sorted(self.deaths.items())))
+
+        # Death heatmap: height on the playfield against time survived
+        peak = max(max(row) for row in self.heatmap) or 1
+        shades = ' .:-=+*#%@'
+        lines.append(f"\nDeath heatmap (rows: top to bottom, columns: {HEATMAP_SECONDS}s each)")
+        for row in self.heatmap:
+            lines.append('  |' + ''.join(shades[count * (len(shades) - 1) // peak] for count in row) + '|')
+
+        lines.append("\nScore distribution")
+        most = max(self.scores.values(), default=1)
+        for bucket in sorted(self.scores):
+            count = self.scores[bucket]
+            lines.append(f"  {bucket:>4}-{bucket + SCORE_BUCKET - 1:<4} {count:8d} {'#' * (count * 40 // most)}")
+
+        if self.purchases:
+            lines.append("\nPurchases")
+            for item, count in sorted(self.purchases.items()):
+                lines.append(f"  {item}: {count}")
+        return "\n".join(lines)
+
+
+def main(paths):
+    aggregate = Aggregate()
+    for event in read_events(paths or log_files()):
+        aggregate.add(event)
+    print(aggregate.report())
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])